@@ -1,14 +1,106 @@
 # extraction/fetch_data.py
+import os
+import threading
+import ijson
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def fetch_data(api_url):
-    """Fetch data from the SpaceX API."""
+ETAG_CACHE_PATH = os.path.join('.cache', 'etags.json')
+
+# Returned by fetch_data when the endpoint is unchanged since the last fetch
+NOT_MODIFIED = object()
+
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (3.05, 30)
+
+_etag_lock = threading.Lock()
+
+# One session for every fetch, so keep-alive connections are reused across calls
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
+SESSION.headers.update({'Accept-Encoding': 'gzip'})
+
+def load_etags():
+    """Load the cached ETag/Last-Modified validators, keyed by URL."""
+    try:
+        with open(ETAG_CACHE_PATH, 'rb') as file:
+            return orjson.loads(file.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
+
+def save_etags(etags):
+    """Write the validators back to the cache file."""
+    os.makedirs(os.path.dirname(ETAG_CACHE_PATH), exist_ok=True)
+    with open(ETAG_CACHE_PATH, 'wb') as file:
+        file.write(orjson.dumps(etags, option=orjson.OPT_INDENT_2))
+
+def save_etag(api_url, validators):
+    """Store a URL's validators once its data has been saved and loaded."""
+    if not validators:
+        return
+    with _etag_lock:
+        etags = load_etags()
+        etags[api_url] = validators
+        save_etags(etags)
+
+def forget_etag(api_url):
+    """Drop the cached validators for a URL so the next run downloads it again."""
+    with _etag_lock:
+        etags = load_etags()
+        if etags.pop(api_url, None) is not None:
+            save_etags(etags)
+
+def iter_records(response):
+    """Yield the items of a streamed JSON array response as they are parsed."""
+    with response:
+        response.raw.decode_content = True  # Let urllib3 undo the gzip encoding
+        yield from ijson.items(response.raw, 'item', use_float=True)
+
+def fetch_data(api_url, stream=False, archive_path=None):
+    """Fetch data from the SpaceX API as (data, validators), or (NOT_MODIFIED, None)."""
     try:
         print(f"Fetching data from {api_url}...")
-        response = requests.get(api_url)
-        response.raise_for_status()
-        print("Data fetched successfully.")
-        return response.json()
+        # Without the local copy a 304 would leave us with no data, so don't revalidate
+        if archive_path is not None and not os.path.exists(archive_path):
+            cached = {}
+        else:
+            with _etag_lock:
+                cached = load_etags().get(api_url, {})
+        headers = {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        response = SESSION.get(api_url, headers=headers, timeout=REQUEST_TIMEOUT, stream=stream)
+        if response.status_code == 304:
+            response.close()
+            print("Data not modified since last fetch.")
+            return NOT_MODIFIED, None
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            response.close()  # Hand the pooled connection back before giving up
+            raise
+        if stream:
+            data = iter_records(response)  # Parsed incrementally, never held in memory whole
+            print("Streaming data.")
+        else:
+            data = orjson.loads(response.content)
+            print("Data fetched successfully.")
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        validators = {'etag': etag, 'last_modified': last_modified} if etag or last_modified else None
+        # The caller saves these with save_etag once the data is loaded, so an
+        # interrupted load is downloaded again on the next run
+        return data, validators
     except requests.exceptions.RequestException as e:
         print(f"Request failed: {e}")
         raise
@@ -1,12 +1,37 @@
 # extraction/save_data.py
+import contextlib
 import os
-import json
+import orjson
 
-def save_data_to_file(data, save_path, table_name):
-    """Save fetched JSON data to a file in the specified path."""
-    if not os.path.exists(save_path):
-        os.makedirs(save_path)
+ZSTD_LEVEL = 3
+
+# 1 MB userspace buffer, so per-record writes don't each become a syscall
+WRITE_BUFFER_SIZE = 1 << 20
+
+def tee_records_to_file(records, save_path, table_name, compress=False):
+    """Yield records unchanged while writing them to <table_name>.json (or .json.zst) as a compact JSON array."""
+    os.makedirs(save_path, exist_ok=True)  # Datasets may share a save path across threads
     file_path = os.path.join(save_path, f"{table_name}.json")
-    with open(file_path, 'w') as file:
-        json.dump(data, file, indent=4)
+    if compress:
+        import zstandard  # Only needed when compression is requested
+
+        file_path += ".zst"
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+    temp_path = file_path + ".tmp"  # Replaces the previous file only once every record is written
+    try:
+        with open(temp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as file:
+            stream = compressor.stream_writer(file) if compress else contextlib.nullcontext(file)
+            with stream as writer:
+                writer.write(b"[")
+                for index, record in enumerate(records):
+                    if index:
+                        writer.write(b",")
+                    writer.write(orjson.dumps(record))
+                    yield record
+                writer.write(b"]")
+    except BaseException:
+        # Also reached via GeneratorExit when the consumer stops early
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, file_path)
     print(f"Data saved to {file_path}")
@@ -1,8 +1,13 @@
 # loading/create_table.py
 from psycopg2 import sql
 
+# Tables already created or verified by this process
+_TABLES_OK = set()
+
 def create_table_if_not_exists(conn, table_name):
     """Create the initial table if it doesn't exist, using TEXT for id."""
+    if table_name in _TABLES_OK:
+        return
     try:
         with conn.cursor() as cursor:
             cursor.execute(sql.SQL("""
@@ -12,6 +17,7 @@ def create_table_if_not_exists(conn, table_name):
                 )
             """).format(sql.Identifier(table_name)))
             conn.commit()
+            _TABLES_OK.add(table_name)
             print(f"Table '{table_name}' created/verified.")
     except Exception as e:
         print(f"Error creating table: {e}")
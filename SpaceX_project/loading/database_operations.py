@@ -1,91 +1,391 @@
 # loading/database_operations.py
+import functools
+import io
+import queue
+import struct
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import orjson
 import psycopg2
 from psycopg2 import sql
-from transformation.process_data import infer_column_type, flatten_json, process_boolean_values
+from transformation.process_data import infer_column_type, merge_column_types, build_row, OJson, BOOLEAN_STRINGS
 
+PAGE_SIZE = 5000
 
-def add_missing_columns(conn, table_name, record):
-    """Dynamically add missing columns to the table based on the flattened record."""
+# Pages allowed to wait between pipeline stages, and how often blocked stages check for a stop
+PIPELINE_DEPTH = 2
+QUEUE_POLL_INTERVAL = 0.1
+
+# Sent down the pipeline once the source is exhausted
+END_OF_PAGES = object()
+
+# Known {column name: data type} per table, kept in sync as ALTERs succeed
+_schema_cache = {}
+
+# Characters that must be backslash-escaped inside a COPY ... FORMAT TEXT field
+COPY_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+# COPY ... FORMAT BINARY framing: signature, flags and header extension length, then the trailer
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_BINARY_TRAILER = struct.pack("!h", -1)
+COPY_BINARY_NULL = struct.pack("!i", -1)
+
+# (existing data type, inferred SQL type) pairs an existing column is widened for
+COLUMN_WIDENINGS = {
+    ("integer", "REAL"): "DOUBLE PRECISION",
+    ("bigint", "REAL"): "DOUBLE PRECISION",
+}
+
+
+def load_existing_columns(conn, table_name, cache):
+    """Return the table's {column: data type}, querying the catalog only on a cache miss."""
+    if table_name not in cache:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL(
+                "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s;"
+            ), [table_name])
+            cache[table_name] = dict(cursor.fetchall())
+    return cache[table_name]
+
+def alter_columns(conn, table_name, clause, column_types, existing_columns, action):
+    """Run one ALTER TABLE applying clause (e.g. "ADD COLUMN {} {}") to each {column: SQL type}."""
+    alter_query = sql.SQL("ALTER TABLE {} {};").format(
+        sql.Identifier(table_name),
+        sql.SQL(', ').join(
+            sql.SQL(clause).format(sql.Identifier(column_name), sql.SQL(column_type))
+            for column_name, column_type in column_types.items()
+        )
+    )
     with conn.cursor() as cursor:
-        cursor.execute(sql.SQL(
-            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s;"
-        ), [table_name])
-        existing_columns = {row[0]: row[1] for row in cursor.fetchall()}
-
-        for key, value in record.items():
-            column_name = key.lower()
-            if column_name not in existing_columns:
-                column_type = infer_column_type(value)
-                alter_query = sql.SQL("ALTER TABLE {} ADD COLUMN {} {};").format(
-                    sql.Identifier(table_name),
-                    sql.Identifier(column_name),
-                    sql.SQL(column_type)
+        try:
+            cursor.execute(alter_query)
+        except Exception as e:
+            print(f"Error altering columns {', '.join(column_types)}: {e}")
+            raise
+
+    existing_columns.update(
+        (column_name, column_type.lower()) for column_name, column_type in column_types.items()
+    )
+    for column_name, column_type in column_types.items():
+        print(f"{action} column: {column_name} ({column_type})")
+
+def add_missing_columns(conn, table_name, column_types, cache):
+    """Dynamically add missing columns to the table, given {column: inferred SQL type}."""
+    existing_columns = load_existing_columns(conn, table_name, cache)
+    missing_columns = {}
+    for column_name, column_type in column_types.items():
+        if column_name not in existing_columns:
+            missing_columns[column_name] = column_type or "TEXT"  # All-null columns default to TEXT
+
+    if missing_columns:
+        alter_columns(conn, table_name, "ADD COLUMN {} {}", missing_columns, existing_columns, "Added missing")
+
+def widen_columns(conn, table_name, column_types, cache):
+    """Widen existing columns whose type can't hold the page's values, e.g. INTEGER receiving floats."""
+    # Older tables were typed from the first record, so integer columns can
+    # later receive fractional values, which COPY rejects
+    existing_columns = load_existing_columns(conn, table_name, cache)
+    widened_columns = {}
+    for column_name, column_type in column_types.items():
+        widened_type = COLUMN_WIDENINGS.get((existing_columns.get(column_name), column_type))
+        if widened_type:
+            widened_columns[column_name] = widened_type
+
+    if widened_columns:
+        alter_columns(conn, table_name, "ALTER COLUMN {} TYPE {}", widened_columns, existing_columns, "Widened")
+
+def table_is_empty(conn, table_name):
+    """Check whether the table has no rows yet."""
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL("SELECT NOT EXISTS (SELECT 1 FROM {});").format(
+            sql.Identifier(table_name)
+        ))
+        return cursor.fetchone()[0]
+
+def copy_text_value(value):
+    """Render a single value as a COPY ... FORMAT TEXT field."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, OJson):
+        value = value.dumps(value.adapted)
+    elif isinstance(value, (dict, list)):
+        value = orjson.dumps(value).decode()
+    else:
+        value = str(value)
+    return value.translate(COPY_TEXT_ESCAPES)
+
+def text_bytes(value):
+    """Render a non-null value as the UTF-8 text Postgres would parse it from."""
+    if isinstance(value, OJson):
+        return orjson.dumps(value.adapted)
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value)
+    return str(value).encode()
+
+def binary_boolean(value):
+    """Encode a boolean field from a bool, 1/0 or a 'true'/'false' string."""
+    if isinstance(value, str):
+        lowered = value.lower()
+        if lowered not in BOOLEAN_STRINGS:
+            raise ValueError(f"Not a boolean string: {value!r}")  # Let the server parse it as text
+        value = lowered == "true"
+    elif type(value) not in (bool, int) or value not in (0, 1):
+        raise ValueError(f"Not a boolean value: {value!r}")
+    return b"\x01" if value else b"\x00"
+
+# Binary encoders per Postgres data type; a column of any other type falls back to text COPY
+COPY_BINARY_ENCODERS = {
+    "integer": struct.Struct("!i").pack,
+    "bigint": struct.Struct("!q").pack,
+    "real": struct.Struct("!f").pack,
+    "double precision": struct.Struct("!d").pack,
+    "boolean": binary_boolean,
+    "text": text_bytes,
+    "json": text_bytes,
+    "jsonb": lambda value: b"\x01" + text_bytes(value),  # jsonb binary format version 1
+    "uuid": lambda value: uuid.UUID(str(value)).bytes,
+}
+
+@functools.lru_cache(maxsize=None)
+def build_copy_query(table_name, columns, copy_format="TEXT"):
+    """Compose the COPY statement for one column set, cached per (table, columns, format)."""
+    return sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT {})").format(
+        sql.Identifier(table_name),
+        sql.SQL(', ').join(sql.Identifier(column) for column in columns),
+        sql.SQL(copy_format)
+    )
+
+def copy_binary_buffer(rows, encoders):
+    """Write rows as a COPY ... FORMAT BINARY stream, one encoder per column."""
+    buffer = io.BytesIO()
+    write = buffer.write
+    field_count = struct.pack("!h", len(encoders))
+    pack_length = struct.Struct("!i").pack
+    write(COPY_BINARY_HEADER)
+    for values in rows:
+        write(field_count)
+        for encode, value in zip(encoders, values):
+            if value is None:
+                write(COPY_BINARY_NULL)
+            else:
+                field = encode(value)
+                write(pack_length(len(field)))
+                write(field)
+    write(COPY_BINARY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+def copy_text_buffer(rows):
+    """Write rows as a COPY ... FORMAT TEXT stream."""
+    buffer = io.StringIO()
+    for values in rows:
+        buffer.write("\t".join(copy_text_value(value) for value in values))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+def bulk_copy_load(conn, table_name, rows, columns, column_types=None):
+    """Load rows into a table with a single COPY FROM STDIN, in binary format where column_types allow."""
+    # Binary skips the server-side text parse, but needs an encoder for every column
+    column_types = column_types or {}
+    encoders = [COPY_BINARY_ENCODERS.get(column_types.get(column)) for column in columns]
+    copy_format, buffer = "BINARY", None
+    if all(encoders):
+        try:
+            buffer = copy_binary_buffer(rows, encoders)
+        except (struct.error, TypeError, ValueError, OverflowError):
+            pass  # A value doesn't fit its column's encoder (e.g. a numeric string in an integer column)
+    if buffer is None:
+        # Send as text and let the server parse and cast each value
+        copy_format, buffer = "TEXT", copy_text_buffer(rows)
+
+    with conn.cursor() as cursor:
+        cursor.copy_expert(build_copy_query(table_name, columns, copy_format).as_string(cursor), buffer)
+
+def align_rows(groups, columns):
+    """Lay out every group's rows in one canonical column order, filling gaps with NULL."""
+    column_index = {column: index for index, column in enumerate(columns)}
+    rows = []
+    for group_columns, group_rows in groups.items():
+        if group_columns == columns:
+            rows.extend(group_rows)
+            continue
+
+        # Resolve positions once per group, then place values by index
+        positions = [column_index[column] for column in group_columns]
+        for values in group_rows:
+            row = [None] * len(columns)
+            for position, value in zip(positions, values):
+                row[position] = value
+            rows.append(row)
+    return rows
+
+def create_staging_table(conn, table_name, staging_table):
+    """(Re)create a temporary copy of the table's current columns, dropped at commit."""
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL("""
+            DROP TABLE IF EXISTS {temp_staging};
+            CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP;
+        """).format(
+            temp_staging=sql.Identifier('pg_temp', staging_table),  # Never drop a real table
+            staging=sql.Identifier(staging_table),
+            table=sql.Identifier(table_name)
+        ))
+
+@functools.lru_cache(maxsize=None)
+def build_merge_query(table_name, staging_table, columns):
+    """Compose the upsert that merges one column set from the staging table, cached per (table, columns)."""
+    update_pairs = [
+        sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(column), sql.Identifier(column))
+        for column in columns
+        if column != "id"  # Skip id in the SET clause
+    ]
+    column_list = sql.SQL(', ').join(sql.Identifier(column) for column in columns)
+    return sql.SQL("""
+        INSERT INTO {table} ({columns})
+        SELECT {columns} FROM {staging}
+        ON CONFLICT (id) DO UPDATE
+        SET {updates};
+        TRUNCATE {staging};
+    """).format(
+        table=sql.Identifier(table_name),
+        staging=sql.Identifier(staging_table),
+        columns=column_list,
+        updates=sql.SQL(', ').join(update_pairs)
+    )
+
+def build_page(records):
+    """Build one page of rows, returning (column_types, rows grouped by column set); touches no database state."""
+    rows_by_id = {}
+    for record in records:
+        record_id = record.get("id")
+        if not record_id:
+            print("Skipping record without 'id'.")
+            continue
+
+        # A repeated id overwrites the earlier record, as sequential upserts would
+        rows_by_id[str(record_id)] = build_row(record)
+
+    # Infer each column's type from every non-null value on the page, widening on
+    # disagreement, so one odd first value can't pick a type the rest won't fit
+    column_types = {}
+    for columns, values in rows_by_id.values():
+        for column, value in zip(columns, values):
+            if value is None:
+                column_types.setdefault(column, None)
+            else:
+                column_types[column] = merge_column_types(
+                    column_types.get(column), infer_column_type(value)
                 )
-                try:
-                    cursor.execute(alter_query)
-                    conn.commit()
-                    print(f"Added missing column: {column_name} ({column_type})")
-                except Exception as e:
-                    print(f"Error adding column {column_name}: {e}")
-                    conn.rollback()
+
+    # Group rows by column set so each group is loaded with one statement
+    groups = {}
+    for columns, values in rows_by_id.values():
+        groups.setdefault(columns, []).append(values)
+    return column_types, groups
+
+def load_page(conn, table_name, column_types, groups):
+    """Insert or update one built page of rows without committing; on error the caller rolls back."""
+    if not groups:
+        return
+
+    # Add any missing columns and widen outgrown ones once for the whole page
+    add_missing_columns(conn, table_name, column_types, _schema_cache)
+    widen_columns(conn, table_name, column_types, _schema_cache)
+
+    try:
+        # Nothing to conflict with on the first load, so COPY the whole page at once
+        if table_is_empty(conn, table_name):
+            columns = tuple(column_types)
+            rows = align_rows(groups, columns)
+            bulk_copy_load(conn, table_name, rows, columns, _schema_cache.get(table_name))
+            print(f"Copied {len(rows)} records into {table_name}")
+            return
+
+        # Otherwise COPY each column set into staging and merge it server-side
+        staging_table = f"{table_name}_staging"
+        create_staging_table(conn, table_name, staging_table)
+        with conn.cursor() as cursor:
+            for columns, rows in groups.items():
+                bulk_copy_load(conn, staging_table, rows, columns, _schema_cache.get(table_name))
+                cursor.execute(build_merge_query(table_name, staging_table, columns))
+                print(f"Inserted/updated {len(rows)} records in {table_name}")
+    except Exception as e:
+        print(f"Error inserting/updating records in {table_name}: {e}")
+        raise
+
+def put_or_stop(out_queue, item, stop):
+    """Put an item on a bounded queue, giving up if the pipeline is stopped."""
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=QUEUE_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def get_or_stop(in_queue, stop):
+    """Take the next item off a queue, or END_OF_PAGES once the pipeline is stopped."""
+    while not stop.is_set():
+        try:
+            return in_queue.get(timeout=QUEUE_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return END_OF_PAGES
+
+def read_pages(records, out_queue, stop):
+    """Fetch stage: pull records off the source PAGE_SIZE at a time."""
+    try:
+        for page in iter(lambda: list(islice(records, PAGE_SIZE)), []):
+            if not put_or_stop(out_queue, page, stop):
+                return
+    finally:
+        put_or_stop(out_queue, END_OF_PAGES, stop)
+
+def build_pages(in_queue, out_queue, stop):
+    """Build stage: turn raw pages into (column_types, groups) for the loader."""
+    try:
+        while True:
+            page = get_or_stop(in_queue, stop)
+            if page is END_OF_PAGES or not put_or_stop(out_queue, build_page(page), stop):
+                return
+    finally:
+        put_or_stop(out_queue, END_OF_PAGES, stop)
 
 def insert_or_update_data(conn, table_name, data):
-    """Insert or update records dynamically into the table."""
-    with conn.cursor() as cursor:
-        for record in data:
-            record_id = record.get("id")
-            if not record_id:
-                print("Skipping record without 'id'.")
-                continue
-
-            # Flatten the record and process boolean values
-            flattened_record = flatten_json(record)
-            flattened_record = process_boolean_values(flattened_record)
-
-            # Add any missing columns dynamically
-            add_missing_columns(conn, table_name, flattened_record)
-
-            # Prepare column names and values
-            columns = []
-            values = []
-            update_pairs = []
-
-            for key, value in flattened_record.items():
-                if key != "id":  # Skip id in the SET clause
-                    columns.append(sql.Identifier(key.lower()))
-                    values.append(value)  # Use value directly (which is now JSONB if needed)
-                    update_pairs.append(
-                        sql.SQL("{} = EXCLUDED.{}").format(
-                            sql.Identifier(key.lower()),
-                            sql.Identifier(key.lower())
-                        )
-                    )
-
-            # Construct the query
-            query = sql.SQL(""" 
-                INSERT INTO {table} ({id_col}, {columns})
-                VALUES (%s, {placeholders})
-                ON CONFLICT (id) DO UPDATE
-                SET {updates}
-            """).format(
-                table=sql.Identifier(table_name),
-                id_col=sql.Identifier('id'),
-                columns=sql.SQL(', ').join(columns),
-                placeholders=sql.SQL(', ').join([sql.SQL('%s')] * len(values)),
-                updates=sql.SQL(', ').join(update_pairs)
-            )
-
-            # Ensure JSON data is passed as JSONB (use Json to handle JSONB columns)
-            processed_values = [
-                Json(value) if isinstance(value, (dict, list)) else value
-                for value in values
-            ]
+    """Insert or update records from any iterable, PAGE_SIZE at a time, committing once at the end."""
+    # Fetch, build and load run as three stages joined by bounded queues, so
+    # the network, disk and database overlap
+    stop = threading.Event()
+    raw_pages = queue.Queue(maxsize=PIPELINE_DEPTH)
+    built_pages = queue.Queue(maxsize=PIPELINE_DEPTH)
 
+    # psycopg2 releases the GIL while it waits on the server, so the
+    # fetch and build stages keep running while this thread writes
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            stages = [
+                executor.submit(read_pages, iter(data), raw_pages, stop),
+                executor.submit(build_pages, raw_pages, built_pages, stop)
+            ]
             try:
-                cursor.execute(query, [str(record_id)] + processed_values)
-                print(f"Inserted/updated record with id: {record_id}")
-            except Exception as e:
-                print(f"Error inserting/updating record with id {record_id}: {e}")
-                conn.rollback()
+                while True:
+                    page = get_or_stop(built_pages, stop)
+                    if page is END_OF_PAGES:
+                        break
+                    column_types, groups = page
+                    load_page(conn, table_name, column_types, groups)
+            finally:
+                stop.set()  # Release stages blocked on a full queue if loading failed
+            for stage in stages:
+                stage.result()  # Re-raise a fetch or build error
+    except Exception:
+        # The single rollback point for the load: a failed page or a streamed
+        # source failing between pages drops everything, including its ALTERs
+        conn.rollback()
+        _schema_cache.pop(table_name, None)  # Rolled-back ALTERs invalidate the cache
+        raise
 
-        conn.commit()
\ No newline at end of file
+    conn.commit()
@@ -1,7 +1,9 @@
 # main.py
-import psycopg2
-from extraction.fetch_data import fetch_data
-from extraction.save_data import save_data_to_file
+import os
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.pool import ThreadedConnectionPool
+from extraction.fetch_data import fetch_data, save_etag, forget_etag, NOT_MODIFIED
+from extraction.save_data import tee_records_to_file
 from loading.create_table import create_table_if_not_exists
 from loading.database_operations import insert_or_update_data
 
@@ -15,15 +17,34 @@ DB_PARAMS = {
 
 SPACEX_API_URL = "https://api.spacexdata.com/v4/"
 
-def fetch_and_process_data(source_url, table_name, save_path, conn):
+MIN_CONNECTIONS = 2
+MAX_CONNECTIONS = 8
+
+def fetch_and_process_data(source_url, table_name, save_path, pool):
+    """Fetch, save and load one dataset on a connection checked out from the pool."""
+    conn = pool.getconn()
     try:
+        create_table_if_not_exists(conn, table_name)
         full_url = SPACEX_API_URL + source_url
-        data = fetch_data(full_url)
-        save_data_to_file(data, save_path, table_name)
-        insert_or_update_data(conn, table_name, data)
+        archive_path = os.path.join(save_path, f"{table_name}.json")
+        records, validators = fetch_data(full_url, stream=True, archive_path=archive_path)
+        if records is NOT_MODIFIED:
+            print(f"Skipping {table_name}: source unchanged since last run")
+            return
+
+        # Records flow from the parser to the archive file and the database page by page
+        archived_records = tee_records_to_file(records, save_path, table_name)
+        try:
+            insert_or_update_data(conn, table_name, archived_records)
+        finally:
+            archived_records.close()  # Removes the partial archive if the load stopped early
+        save_etag(full_url, validators)  # Only trust a 304 once the load has committed
         print(f"Data successfully inserted into {table_name}")
     except Exception as e:
         print(f"Error during data processing for {table_name}: {e}")
+        forget_etag(SPACEX_API_URL + source_url)  # Reload it on the next run
+    finally:
+        pool.putconn(conn)
 
 
 def main():
@@ -33,21 +54,26 @@ def main():
     ]
 
     try:
-        conn = psycopg2.connect(**DB_PARAMS)
+        pool = ThreadedConnectionPool(MIN_CONNECTIONS, MAX_CONNECTIONS, **DB_PARAMS)
         print("Database connected successfully.")
     except Exception as e:
         print(f"Failed to connect to the database: {e}")
         return
 
-    for dataset in datasets:
-        table_name = dataset['table_name']
-        source_url = dataset['source_url']
-        save_path = dataset['save_path']
-
-        create_table_if_not_exists(conn, table_name)
-        fetch_and_process_data(source_url, table_name, save_path, conn)
+    # Run each dataset's whole pipeline on its own worker and connection; the
+    # pool raises instead of blocking when exhausted, so cap workers at its size
+    with ThreadPoolExecutor(max_workers=min(len(datasets), MAX_CONNECTIONS)) as executor:
+        pipelines = [
+            executor.submit(
+                fetch_and_process_data,
+                dataset['source_url'], dataset['table_name'], dataset['save_path'], pool
+            )
+            for dataset in datasets
+        ]
+        for pipeline in pipelines:
+            pipeline.result()
 
-    conn.close()
+    pool.closeall()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,7 +1,9 @@
 import requests
-import json
+import orjson
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
+from collections import defaultdict
 import os
 from uuid import UUID
 
@@ -17,6 +19,28 @@ SPACEX_API_URL = "https://api.spacexdata.com/v4/"
 
 POSTGRES_RESERVED_KEYWORDS = {"window"}
 
+# sql.Identifier and "col = EXCLUDED.col" fragments, built once per column name
+_IDENT_CACHE = {}
+_UPDATE_PAIR_CACHE = {}
+
+# Tables known to exist, and each table's known columns, for this process
+_TABLES_OK = set()
+_TABLE_COLS = {}
+
+def ident(name):
+    """Return a cached sql.Identifier for a table or column name."""
+    identifier = _IDENT_CACHE.get(name)
+    if identifier is None:
+        identifier = _IDENT_CACHE[name] = sql.Identifier(name)
+    return identifier
+
+def update_pair(name):
+    """Return the cached "col = EXCLUDED.col" fragment for a column."""
+    pair = _UPDATE_PAIR_CACHE.get(name)
+    if pair is None:
+        pair = _UPDATE_PAIR_CACHE[name] = sql.SQL("{} = EXCLUDED.{}").format(ident(name), ident(name))
+    return pair
+
 def fetch_data(api_url):
     """Fetch data from the SpaceX API."""
     try:
@@ -24,7 +48,7 @@ def fetch_data(api_url):
         response = requests.get(api_url)
         response.raise_for_status()
         print("Data fetched successfully.")
-        return response.json()
+        return orjson.loads(response.content)
     except requests.exceptions.RequestException as e:
         print(f"Request failed: {e}")
         raise
@@ -35,30 +59,37 @@ def save_data_to_file(data, save_path, table_name):
     if not os.path.exists(save_path):
         os.makedirs(save_path)
     file_path = os.path.join(save_path, f"{table_name}.json")
-    with open(file_path, 'w') as file:
-        json.dump(data, file, indent=4)
+    with open(file_path, 'wb') as file:
+        file.write(orjson.dumps(data))
     print(f"Data saved to {file_path}")
 
 def flatten_json(data, prefix=''):
     """Flatten nested JSON data into a single dictionary."""
     flattened = {}
-    for key, value in data.items():
-        new_key = f"{prefix}{key}".lower()
-        if isinstance(value, dict):
-            flattened.update(flatten_json(value, prefix=new_key + '_'))
-        elif isinstance(value, list):
-            flattened[new_key] = json.dumps(value)  # Store list as JSON string
-        elif isinstance(value, bool):
-            flattened[new_key] = value  # Keep booleans as booleans
-        elif isinstance(value, UUID):
-            flattened[new_key] = str(value)  # Convert UUID to string
-        else:
-            flattened[new_key] = value
+    # Walk nested dicts with an explicit stack instead of recursing per level
+    stack = [(prefix, data)]
+    push = stack.append
+    set_value = flattened.__setitem__
+    while stack:
+        current_prefix, current = stack.pop()
+        for key, value in current.items():
+            new_key = f"{current_prefix}{key}".lower()
+            value_type = type(value)
+            if value_type is dict:
+                push((new_key + '_', value))
+            elif value_type is list:
+                set_value(new_key, orjson.dumps(value).decode())  # Store list as JSON string
+            elif value_type is UUID:
+                set_value(new_key, str(value))  # Convert UUID to string
+            else:
+                set_value(new_key, value)  # Booleans stay booleans
     return flattened
 
 def infer_column_type(value):
     """Infer the SQL column type based on the value."""
-    if isinstance(value, int):
+    if isinstance(value, bool):  # bool is a subclass of int, so check it first
+        return "BOOLEAN"
+    elif isinstance(value, int):
         return "INTEGER"
     elif isinstance(value, float):
         return "REAL"
@@ -66,8 +97,6 @@ def infer_column_type(value):
         if value.lower() in ('true', 'false'):
             return "BOOLEAN"
         return "TEXT"
-    elif isinstance(value, bool):
-        return "BOOLEAN"
     elif isinstance(value, UUID):
         return "UUID"
     elif value is None:
@@ -97,21 +126,17 @@ def remove_data_column_if_exists(conn, table_name):
                 print(f"Error dropping 'data' column: {e}")
                 conn.rollback()
 
+# Boolean strings as they appear in the data, mapped straight to 1/0
+_BOOL_STR = {'true': 1, 'True': 1, 'TRUE': 1, 'false': 0, 'False': 0, 'FALSE': 0}
+
 def process_boolean_values(data):
-    """Convert boolean values in the data to integers (0 or 1)."""
-    processed_data = {}
-    for key, value in data.items():
-        if isinstance(value, str):
-            lower_value = value.lower()
-            if lower_value == 'true':
-                processed_data[key] = 1  # Integer representation of True
-            elif lower_value == 'false':
-                processed_data[key] = 0  # Integer representation of False
-            else:
-                processed_data[key] = value
-        else:
-            processed_data[key] = 1 if value else 0 if isinstance(value, bool) else value
-    return processed_data
+    """Convert boolean values (and 'true'/'false' strings) in the data to integers (0 or 1)."""
+    return {
+        key: int(value) if type(value) is bool
+        else _BOOL_STR.get(value, value) if type(value) is str
+        else value
+        for key, value in data.items()
+    }
 
 def escape_column_name(column_name):
     """Escape SQL column names to prevent conflicts with reserved keywords."""
@@ -122,10 +147,12 @@ def escape_column_name(column_name):
 def add_missing_columns(conn, table_name, record):
     """Dynamically add missing columns to the table based on the flattened record."""
     with conn.cursor() as cursor:
-        cursor.execute(sql.SQL(
-            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s;"
-        ), [table_name])
-        existing_columns = {row[0]: row[1] for row in cursor.fetchall()}
+        existing_columns = _TABLE_COLS.get(table_name)
+        if existing_columns is None:
+            cursor.execute(sql.SQL(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = %s;"
+            ), [table_name])
+            existing_columns = _TABLE_COLS[table_name] = {row[0] for row in cursor.fetchall()}
 
         for key, value in record.items():
             column_name = key.lower()
@@ -137,65 +164,119 @@ def add_missing_columns(conn, table_name, record):
                     sql.SQL(column_type)
                 )
                 try:
+                    cursor.execute("SAVEPOINT add_column")
                     cursor.execute(alter_query)
-                    conn.commit()
+                    cursor.execute("RELEASE SAVEPOINT add_column")
+                    existing_columns.add(column_name)
                     print(f"Added missing column: {column_name} ({column_type})")
                 except Exception as e:
                     print(f"Error adding column {column_name}: {e}")
-                    conn.rollback()
+                    # Only undo the failed ALTER, not the rest of the batch
+                    cursor.execute("ROLLBACK TO SAVEPOINT add_column")
 
 def create_table_if_not_exists(conn, table_name):
     """Create the initial table if it doesn't exist."""
-    try:
-        with conn.cursor() as cursor:
+    if table_name in _TABLES_OK:
+        return
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute("SAVEPOINT create_table")
             cursor.execute(sql.SQL("""
                 CREATE TABLE IF NOT EXISTS {} (
                     id TEXT PRIMARY KEY,
                     data TEXT
                 )
             """).format(sql.Identifier(table_name)))
-            conn.commit()
+            cursor.execute("RELEASE SAVEPOINT create_table")
+            _TABLES_OK.add(table_name)
             print(f"Table '{table_name}' created/verified.")
-    except Exception as e:
-        print(f"Error creating table: {e}")
-        conn.rollback()
-
-
-
-def process_nested_json(conn, parent_table, parent_id, data, parent_fk_column="parent_id"):
-    """Recursively process nested JSON objects and insert them into child tables."""
-    for key, value in data.items():
-        if isinstance(value, dict):
-            # Create a child table for the nested object
-            child_table = f"{parent_table}_{key}"
-            create_table_if_not_exists(conn, child_table)  # Ensure child table exists
-
-            # Flatten the nested object and insert it into the child table
-            flattened_child = flatten_json(value)
-            flattened_child[parent_fk_column] = parent_id  # Add foreign key
-            insert_or_update_data(conn, child_table, [flattened_child])
-
-            # Recursive call for further nested dictionaries
-            process_nested_json(conn, child_table, parent_id, value, parent_fk_column)
-        
-        elif isinstance(value, list):
-            # Lists are stored as rows in a child table
-            child_table = f"{parent_table}_{key}"
+        except Exception as e:
+            print(f"Error creating table: {e}")
+            cursor.execute("ROLLBACK TO SAVEPOINT create_table")
+
+
+
+def iter_nested_rows(parent_table, parent_id, data, parent_fk_column="parent_id"):
+    """Walk a record's nested objects and lists once, yielding (child_table, row) pairs."""
+    stack = [(parent_table, data)]
+    while stack:
+        current_table, current = stack.pop()
+        for key, value in current.items():
+            child_table = f"{current_table}_{key}"
+            if isinstance(value, dict):
+                # Flatten the nested object into a row for its child table
+                flattened_child = flatten_json(value)
+                flattened_child[parent_fk_column] = parent_id  # Add foreign key
+                yield child_table, flattened_child
+
+                # Visit further nested dictionaries later in the same walk
+                stack.append((child_table, value))
+
+            elif isinstance(value, list):
+                # Lists are stored as rows in a child table
+                for idx, item in enumerate(value):
+                    if isinstance(item, dict):  # Process list of dictionaries
+                        flattened_item = flatten_json(item)
+                        flattened_item[parent_fk_column] = parent_id
+                        flattened_item["item_index"] = idx  # Add index for list position
+                    else:
+                        # Non-dictionary items in lists can be inserted directly
+                        flattened_item = {parent_fk_column: parent_id, "value": item, "item_index": idx}
+                    yield child_table, flattened_item
+
+def collect_nested_rows(child_rows, parent_table, parent_id, data, parent_fk_column="parent_id"):
+    """Add a record's child rows to child_rows ({table: {id: row}}); later ids win."""
+    for child_table, row in iter_nested_rows(parent_table, parent_id, data, parent_fk_column):
+        if not row.get("id"):
+            print("Skipping record without 'id'.")
+            continue
+        child_rows[child_table][row["id"]] = row
+
+def insert_child_rows(conn, child_rows):
+    """Insert the collected child rows with one execute_values call per child table and column set."""
+    with conn.cursor() as cursor:
+        for child_table, rows_by_id in child_rows.items():
             create_table_if_not_exists(conn, child_table)  # Ensure child table exists
+            rows = [process_boolean_values(row) for row in rows_by_id.values()]
+
+            # Sync the schema once per table, using the first non-null value per column
+            sample_row = {}
+            for row in rows:
+                for key, value in row.items():
+                    if sample_row.get(key) is None:
+                        sample_row[key] = value
+            add_missing_columns(conn, child_table, sample_row)
+
+            # Upsert each column set separately, so a row that lacks a column
+            # doesn't overwrite it with NULL on conflict
+            groups = defaultdict(list)
+            for row in rows:
+                groups[tuple(row)].append(tuple(row.values()))
+
+            for columns, values in groups.items():
+                query = sql.SQL("""
+                    INSERT INTO {table} ({columns})
+                    VALUES %s
+                    ON CONFLICT (id) DO UPDATE
+                    SET {updates}
+                """).format(
+                    table=ident(child_table),
+                    columns=sql.SQL(', ').join(ident(column) for column in columns),
+                    updates=sql.SQL(', ').join(update_pair(column) for column in columns if column != "id")
+                )
 
-            for idx, item in enumerate(value):
-                if isinstance(item, dict):  # Process list of dictionaries
-                    flattened_item = flatten_json(item)
-                    flattened_item[parent_fk_column] = parent_id
-                    flattened_item["item_index"] = idx  # Add index for list position
-                    insert_or_update_data(conn, child_table, [flattened_item])
-                else:
-                    # Non-dictionary items in lists can be inserted directly
-                    simple_record = {parent_fk_column: parent_id, "value": item, "item_index": idx}
-                    insert_or_update_data(conn, child_table, [simple_record])
+                try:
+                    cursor.execute("SAVEPOINT child_rows")
+                    execute_values(cursor, query, values, page_size=1000)
+                    cursor.execute("RELEASE SAVEPOINT child_rows")
+                    print(f"Inserted/updated {len(values)} rows in {child_table}")
+                except Exception as e:
+                    print(f"Error inserting/updating rows in {child_table}: {e}")
+                    cursor.execute("ROLLBACK TO SAVEPOINT child_rows")  # Keep the parents and other groups
 
 def insert_or_update_data(conn, table_name, data):
     """Insert or update records dynamically into the table."""
+    child_rows = defaultdict(dict)  # Nested rows for the whole batch, inserted at the end
     with conn.cursor() as cursor:
         for record in data:
             record_id = record.get("id")
@@ -215,14 +296,10 @@ def insert_or_update_data(conn, table_name, data):
 
             for key, value in flattened_record.items():
                 if key != "id":
-                    columns.append(sql.Identifier(key.lower()))
+                    column_name = key.lower()
+                    columns.append(ident(column_name))
                     values.append(value)
-                    update_pairs.append(
-                        sql.SQL("{} = EXCLUDED.{}").format(
-                            sql.Identifier(key.lower()),
-                            sql.Identifier(key.lower())
-                        )
-                    )
+                    update_pairs.append(update_pair(column_name))
 
             query = sql.SQL("""
                 INSERT INTO {table} ({id_col}, {columns})
@@ -230,22 +307,32 @@ def insert_or_update_data(conn, table_name, data):
                 ON CONFLICT (id) DO UPDATE
                 SET {updates}
             """).format(
-                table=sql.Identifier(table_name),
-                id_col=sql.Identifier('id'),
+                table=ident(table_name),
+                id_col=ident('id'),
                 columns=sql.SQL(', ').join(columns),
                 placeholders=sql.SQL(', ').join([sql.SQL('%s')] * len(values)),
                 updates=sql.SQL(', ').join(update_pairs)
             )
 
+            # A failed record only rolls back to its own savepoint, and its
+            # child rows are only kept once the parent row is in
+            record_child_rows = defaultdict(dict)
             try:
+                cursor.execute("SAVEPOINT record")
                 cursor.execute(query, [str(record_id)] + values)
-                print(f"Inserted/updated record with id: {record_id}")
-                process_nested_json(conn, table_name, record_id, record)
+                collect_nested_rows(record_child_rows, table_name, record_id, record)
+                cursor.execute("RELEASE SAVEPOINT record")
             except Exception as e:
                 print(f"Error inserting/updating record with id {record_id}: {e}")
-                conn.rollback()
+                cursor.execute("ROLLBACK TO SAVEPOINT record")
+                continue
+
+            print(f"Inserted/updated record with id: {record_id}")
+            for child_table, rows_by_id in record_child_rows.items():
+                child_rows[child_table].update(rows_by_id)
 
-        conn.commit()
+    insert_child_rows(conn, child_rows)
+    conn.commit()
 
 
 def fetch_and_process_data(source_url, table_name, save_path, conn):
@@ -257,6 +344,10 @@ def fetch_and_process_data(source_url, table_name, save_path, conn):
         print(f"Data successfully inserted into {table_name}")
     except Exception as e:
         print(f"Error during data processing for {table_name}: {e}")
+        conn.rollback()
+        # Uncommitted CREATEs and ALTERs went with the rollback
+        _TABLES_OK.clear()
+        _TABLE_COLS.clear()
 
 def main():
     datasets = [
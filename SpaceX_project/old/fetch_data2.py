@@ -1,5 +1,5 @@
 import requests
-import json
+import orjson
 import psycopg2
 from psycopg2 import sql
 import os
@@ -17,41 +17,70 @@ SPACEX_API_URL = "https://api.spacexdata.com/v4/"
 
 POSTGRES_RESERVED_KEYWORDS = {"window"}
 
+# sql.Identifier and "col = EXCLUDED.col" fragments, built once per column name
+_IDENT_CACHE = {}
+_UPDATE_PAIR_CACHE = {}
+
+# Tables known to exist, and each table's known columns, for this process
+_TABLES_OK = set()
+_TABLE_COLS = {}
+
+def ident(name):
+    """Return a cached sql.Identifier for a table or column name."""
+    identifier = _IDENT_CACHE.get(name)
+    if identifier is None:
+        identifier = _IDENT_CACHE[name] = sql.Identifier(name)
+    return identifier
+
+def update_pair(name):
+    """Return the cached "col = EXCLUDED.col" fragment for a column."""
+    pair = _UPDATE_PAIR_CACHE.get(name)
+    if pair is None:
+        pair = _UPDATE_PAIR_CACHE[name] = sql.SQL("{} = EXCLUDED.{}").format(ident(name), ident(name))
+    return pair
+
 def fetch_data(api_url):
     """Fetch data from the SpaceX API."""
     print(f"Fetching data from {api_url}...")
     response = requests.get(api_url)
     response.raise_for_status()
     print("Data fetched successfully.")
-    return response.json()
+    return orjson.loads(response.content)
 
 def save_data_to_file(data, save_path, table_name):
     """Save fetched JSON data to a file in the specified path."""
     if not os.path.exists(save_path):
         os.makedirs(save_path)
     file_path = os.path.join(save_path, f"{table_name}.json")
-    with open(file_path, 'w') as file:
-        json.dump(data, file, indent=4)
+    with open(file_path, 'wb') as file:
+        file.write(orjson.dumps(data))
     print(f"Data saved to {file_path}")
 
 def flatten_json(data, prefix=''):
     """Flatten nested JSON data into a single dictionary."""
     flattened = {}
-    for key, value in data.items():
-        new_key = f"{prefix}{key}".lower()
-        if isinstance(value, dict):
-            flattened.update(flatten_json(value, prefix=new_key + '_'))
-        elif isinstance(value, list):
-            flattened[new_key] = json.dumps(value)  # Store list as JSON string
-        elif isinstance(value, bool):
-            flattened[new_key] = value  # Keep booleans as booleans
-        else:
-            flattened[new_key] = value
+    # Walk nested dicts with an explicit stack instead of recursing per level
+    stack = [(prefix, data)]
+    push = stack.append
+    set_value = flattened.__setitem__
+    while stack:
+        current_prefix, current = stack.pop()
+        for key, value in current.items():
+            new_key = f"{current_prefix}{key}".lower()
+            value_type = type(value)
+            if value_type is dict:
+                push((new_key + '_', value))
+            elif value_type is list:
+                set_value(new_key, orjson.dumps(value).decode())  # Store list as JSON string
+            else:
+                set_value(new_key, value)  # Booleans stay booleans
     return flattened
 
 def infer_column_type(value):
     """Infer the SQL column type based on the value."""
-    if isinstance(value, int):
+    if isinstance(value, bool):  # bool is a subclass of int, so check it first
+        return "BOOLEAN"
+    elif isinstance(value, int):
         return "INTEGER"
     elif isinstance(value, float):
         return "REAL"
@@ -59,8 +88,6 @@ def infer_column_type(value):
         if value.lower() in ('true', 'false'):
             return "BOOLEAN"
         return "TEXT"
-    elif isinstance(value, bool):
-        return "BOOLEAN"
     elif value is None:
         return "TEXT"
     else:
@@ -88,21 +115,17 @@ def remove_data_column_if_exists(conn, table_name):
                 print(f"Error dropping 'data' column: {e}")
                 conn.rollback()
 
+# Boolean strings as they appear in the data, mapped straight to 1/0
+_BOOL_STR = {'true': 1, 'True': 1, 'TRUE': 1, 'false': 0, 'False': 0, 'FALSE': 0}
+
 def process_boolean_values(data):
-    """Convert boolean values in the data to integers (0 or 1)."""
-    processed_data = {}
-    for key, value in data.items():
-        if isinstance(value, str):
-            lower_value = value.lower()
-            if lower_value == 'true':
-                processed_data[key] = 1  # Integer representation of True
-            elif lower_value == 'false':
-                processed_data[key] = 0  # Integer representation of False
-            else:
-                processed_data[key] = value
-        else:
-            processed_data[key] = 1 if value else 0 if isinstance(value, bool) else value
-    return processed_data
+    """Convert boolean values (and 'true'/'false' strings) in the data to integers (0 or 1)."""
+    return {
+        key: int(value) if type(value) is bool
+        else _BOOL_STR.get(value, value) if type(value) is str
+        else value
+        for key, value in data.items()
+    }
 
 def escape_column_name(column_name):
     """Escape SQL column names to prevent conflicts with reserved keywords."""
@@ -113,10 +136,12 @@ def escape_column_name(column_name):
 def add_missing_columns(conn, table_name, record):
     """Dynamically add missing columns to the table based on the flattened record."""
     with conn.cursor() as cursor:
-        cursor.execute(sql.SQL(
-            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s;"
-        ), [table_name])
-        existing_columns = {row[0]: row[1] for row in cursor.fetchall()}
+        existing_columns = _TABLE_COLS.get(table_name)
+        if existing_columns is None:
+            cursor.execute(sql.SQL(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = %s;"
+            ), [table_name])
+            existing_columns = _TABLE_COLS[table_name] = {row[0] for row in cursor.fetchall()}
 
         for key, value in record.items():
             column_name = key.lower()
@@ -129,15 +154,17 @@ def add_missing_columns(conn, table_name, record):
                 )
                 try:
                     cursor.execute(alter_query)
-                    conn.commit()
+                    existing_columns.add(column_name)
                     print(f"Added missing column: {column_name} ({column_type})")
                 except Exception as e:
                     print(f"Error adding column {column_name}: {e}")
-                    conn.rollback()
+                    raise
 
                     
 def create_table_if_not_exists(conn, table_name):
     """Create the initial table if it doesn't exist, using TEXT for id."""
+    if table_name in _TABLES_OK:
+        return
     try:
         with conn.cursor() as cursor:
             cursor.execute(sql.SQL("""
@@ -147,6 +174,7 @@ def create_table_if_not_exists(conn, table_name):
                 )
             """).format(sql.Identifier(table_name)))
             conn.commit()
+            _TABLES_OK.add(table_name)
             print(f"Table '{table_name}' created/verified.")
     except Exception as e:
         print(f"Error creating table: {e}")
@@ -176,14 +204,10 @@ def insert_or_update_data(conn, table_name, data):
 
             for key, value in flattened_record.items():
                 if key != "id":  # Skip id in the SET clause
-                    columns.append(sql.Identifier(key.lower()))
+                    column_name = key.lower()
+                    columns.append(ident(column_name))
                     values.append(value)
-                    update_pairs.append(
-                        sql.SQL("{} = EXCLUDED.{}").format(
-                            sql.Identifier(key.lower()),
-                            sql.Identifier(key.lower())
-                        )
-                    )
+                    update_pairs.append(update_pair(column_name))
 
             # Construct the query
             query = sql.SQL("""
@@ -192,8 +216,8 @@ def insert_or_update_data(conn, table_name, data):
                 ON CONFLICT (id) DO UPDATE
                 SET {updates}
             """).format(
-                table=sql.Identifier(table_name),
-                id_col=sql.Identifier('id'),
+                table=ident(table_name),
+                id_col=ident('id'),
                 columns=sql.SQL(', ').join(columns),
                 placeholders=sql.SQL(', ').join([sql.SQL('%s')] * len(values)),
                 updates=sql.SQL(', ').join(update_pairs)
@@ -204,19 +228,21 @@ def insert_or_update_data(conn, table_name, data):
                 print(f"Inserted/updated record with id: {record_id}")
             except Exception as e:
                 print(f"Error inserting/updating record with id {record_id}: {e}")
-                conn.rollback()
-
-        conn.commit()
+                raise
 
 def fetch_and_process_data(source_url, table_name, save_path, conn):
+    """Fetch, save and load one dataset as a single transaction."""
     try:
         full_url = SPACEX_API_URL + source_url
         data = fetch_data(full_url)
         save_data_to_file(data, save_path, table_name)
         insert_or_update_data(conn, table_name, data)
+        conn.commit()
         print(f"Data successfully inserted into {table_name}")
     except Exception as e:
         print(f"Error during data processing for {table_name}: {e}")
+        conn.rollback()
+        _TABLE_COLS.pop(table_name, None)  # Rolled-back ALTERs invalidate the cache
 
 def main():
     datasets = [
@@ -234,6 +260,7 @@ def main():
 
     try:
         conn = psycopg2.connect(**DB_PARAMS)
+        conn.autocommit = False  # Each dataset commits once, in fetch_and_process_data
         print("Database connected successfully.")
     except Exception as e:
         print(f"Failed to connect to the database: {e}")
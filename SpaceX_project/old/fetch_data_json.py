@@ -1,6 +1,6 @@
 import os
 import requests
-import json
+import orjson
 
 # Configurations
 SPACEX_API_URL = "https://api.spacexdata.com/v4/"
@@ -31,12 +31,12 @@ def fetch_and_save_data(dataset):
     # Fetch the data
     response = requests.get(SPACEX_API_URL + source_url)
     if response.status_code == 200:
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Save the data to a JSON file
         file_path = os.path.join(save_path, f"{table_name}.json")
-        with open(file_path, "w") as json_file:
-            json.dump(data, json_file, indent=4)
+        with open(file_path, "wb") as json_file:
+            json_file.write(orjson.dumps(data))
         
         print(f"Data saved for table '{table_name}' at {file_path}")
     else:
@@ -1,8 +1,8 @@
+import io
 import psycopg2
-import json
+import orjson
 import os
 import pandas as pd
-from psycopg2 import sql
 
 # Configurations
 DATABASE_CONFIG = {
@@ -48,17 +48,31 @@ def get_postgres_type(series):
     else:
         return 'TEXT'
 
+def to_json_cell(value):
+    # Lists and dicts are stored as JSON text, not as their Python repr
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value).decode()
+    return value
+
 def insert_data_to_db(table_name, df, conn):
+    df = df.assign(**{
+        col: df[col].map(to_json_cell) for col in df.columns if df[col].dtype == object
+    })
+
+    # Serialize the whole frame once and load it with a single COPY
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep='\\N')
+    buffer.seek(0)
     with conn.cursor() as cursor:
-        for _, row in df.iterrows():
-            insert_query = sql.SQL(
-                f"INSERT INTO {table_name} ({', '.join(df.columns)}) VALUES ({', '.join(['%s'] * len(row))})"
-            )
-            cursor.execute(insert_query, tuple(row))
+        cursor.copy_expert(
+            f"COPY {table_name} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer
+        )
         conn.commit()
 
 def parse_nested_data(df):
-    nested_columns = [col for col in df.columns if isinstance(df[col].iloc[0], dict)]
+    # Detect nested columns across every row, not just the first one
+    nested_columns = [col for col in df.columns if df[col].map(type).eq(dict).any()]
     
     for col in nested_columns:
         nested_df = pd.json_normalize(df[col])
@@ -77,8 +91,8 @@ def upload_data_to_db():
     conn = connect_to_db()
 
     for dataset in datasets:
-        with open(dataset['save_path'], 'r') as f:
-            data = json.load(f)
+        with open(dataset['save_path'], 'rb') as f:
+            data = orjson.loads(f.read())
         
         # Convert to DataFrame
         df = pd.json_normalize(data)
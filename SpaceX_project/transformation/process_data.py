@@ -1,66 +1,118 @@
 # transformation/process_data.py
+import functools
 import json  # To work with JSON data
+import sys
 import uuid  # To work with UUIDs
+import orjson
 from psycopg2 import sql
 from psycopg2.extras import Json
 
 POSTGRES_RESERVED_KEYWORDS = {"window"}
 
+class OJson(Json):
+    """JSONB adapter that serializes with orjson instead of the stdlib json module."""
+
+    def dumps(self, obj):
+        return orjson.dumps(obj).decode()
+
+# Lower-cased keys, memoized since the same API keys repeat across every record
+lower_key = functools.lru_cache(maxsize=None)(str.lower)
+
+# Expand nested objects into prefixed columns instead of storing them as JSONB
+FLATTEN_NESTED = False
+
+# Lower-case keys while flattening; the SpaceX API already uses lower snake_case
+# for every top-level field, so by default keys are only interned
+NORMALIZE_KEY_CASE = False
+
+BOOLEAN_STRINGS = ('true', 'false')
+
+# Column types for exact value types, checked before any isinstance fallback
+COLUMN_TYPES = {
+    bool: "BOOLEAN",
+    int: "INTEGER",
+    float: "REAL",
+    dict: "jsonb",
+    list: "jsonb",
+    Json: "jsonb",
+    OJson: "jsonb",
+    uuid.UUID: "UUID",
+    type(None): "TEXT",
+}
+
 def escape_column_name(column_name):
     """Escape SQL column names to prevent conflicts with reserved keywords."""
     if column_name in POSTGRES_RESERVED_KEYWORDS:
         return sql.Identifier(column_name)
     return sql.Identifier(column_name)
 
-def process_boolean_values(data):
-    """Process boolean values to ensure they're correctly handled."""
-    for key, value in data.items():
-        if isinstance(value, bool):
-            data[key] = 1 if value else 0  # Convert boolean to integer (1 or 0)
-        elif isinstance(value, dict):
-            process_boolean_values(value)
-        elif isinstance(value, list):
-            for item in value:
-                if isinstance(item, dict):
-                    process_boolean_values(item)
-    return data
+def build_row(record, prefix=''):
+    """Walk a record once and return parallel (columns, values) tuples ready for the database."""
+    columns = []
+    values = []
+    stack = [(prefix, record)]
+
+    # Bind the hot-loop methods once instead of looking them up per key
+    normalize_key = lower_key if NORMALIZE_KEY_CASE else sys.intern
+    add_column = columns.append
+    add_value = values.append
+    push = stack.append
+    pop = stack.pop
+    while stack:
+        current_prefix, current = pop()
+        for key, value in current.items():
+            new_key = normalize_key(current_prefix + key)
+            # Decoded JSON only yields exact dicts, lists and bools
+            value_type = type(value)
+            if value_type is dict:
+                if FLATTEN_NESTED:
+                    push((new_key + '_', value))  # Expand into prefixed columns
+                    continue
+                value = OJson(value)  # Convert dict to JSONB
+            elif value_type is list:
+                value = OJson(value)  # Convert list to JSONB
+            elif value_type is bool:
+                value = 1 if value else 0  # Convert boolean to integer (1 or 0)
+            add_column(new_key)
+            add_value(value)
+    return tuple(columns), tuple(values)
 
 
 def flatten_json(data, prefix=''):
     """Flatten nested JSON data into a single dictionary, converting dicts/lists to JSONB."""
-    flattened = {}
-    for key, value in data.items():
-        new_key = f"{prefix}{key}".lower()
-        if isinstance(value, dict):
-            flattened[new_key] = Json(value)  # Convert dict to JSONB
-        elif isinstance(value, list):
-            flattened[new_key] = Json(value)  # Convert list to JSONB
-        elif isinstance(value, bool):
-            flattened[new_key] = value  # Keep booleans as booleans
-        else:
-            flattened[new_key] = value
-    return flattened
+    return dict(zip(*build_row(data, prefix)))
 
 def infer_column_type(value):
     """Infer the SQL column type based on the value."""
-    if isinstance(value, int):
+    column_type = COLUMN_TYPES.get(type(value))
+    if column_type is not None:
+        return column_type
+
+    # Strings need a look at the value; subclasses fall back to isinstance
+    if isinstance(value, str):
+        # Only short strings can spell a boolean, so skip lower() for the rest
+        if len(value) <= 5 and value.lower() in BOOLEAN_STRINGS:
+            return "BOOLEAN"
+        return "TEXT"
+    elif isinstance(value, int):
         return "INTEGER"
     elif isinstance(value, float):
         return "REAL"
-    elif isinstance(value, str):
-        if value.lower() in ('true', 'false'):
-            return "BOOLEAN"
-        return "TEXT"
-    elif isinstance(value, bool):
-        return "BOOLEAN"
-    elif isinstance(value, dict) or isinstance(value, list):
+    elif isinstance(value, (dict, list, Json)):
         return "jsonb"  # Ensure dicts and lists are stored as jsonb
-    elif value is None:
-        return "TEXT"
     else:
         return "TEXT"
     
 
+def merge_column_types(current, new):
+    """Widen two inferred column types to one that holds values of both."""
+    if current is None or current == new:
+        return new
+    if {current, new} == {"INTEGER", "REAL"}:
+        return "REAL"
+    return "TEXT"
+
+
 def remove_data_column_if_exists(conn, table_name):
     """Remove the 'data' column from the table if it exists."""
     with conn.cursor() as cursor: